@@ -1,8 +1,11 @@
-import threading
-import queue
-import time
-import random
+import asyncio
+import logging
+from collections import defaultdict
 import matplotlib.pyplot as plt
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
 
 SINGLE_BIT = 1
 DOUBLE_BIT = 2
@@ -10,209 +13,250 @@ BURST = 3
 
 MAX_SPEED = 120 
 TURN_FREQUENCY = 5  
-AGING_FACTOR = 2 
+TIME_STEP = 1
+SIMULATION_TIME = 5
+TICKS = SIMULATION_TIME // TIME_STEP
+LOG_HISTORY = False  # keep full per-tick speed/position series, not just running totals
+
+STRAIGHT, LEFT, RIGHT = range(3)
+DIRECTIONS = ["straight", "left", "right"]
+NO_LEADER = -1
+
+# Yes/no decisions every vehicle makes each tick, and the probability of each
+WANTS_TO_TURN, AT_INTERSECTION, CAN_TURN, SPOTS_OBSTACLE = range(4)
+DECISION_PROBABILITIES = np.array([0.3, 0.2, 0.5, 0.05])
 
 time_data = []
 speed_data = {}
 position_data = {}
 resync_time_data = {}
 cwnd_data = {}
-metrics_lock = threading.Lock()
+
+_BIN8 = [f"{i:08b}" for i in range(256)]
 
 def int_to_binary_string(n, bits=8):
     """ Convert integer to binary string representation """
+    if bits == 8:
+        return _BIN8[n]
     return f"{n:0{bits}b}"
 
-class Vehicle(threading.Thread):
-    def __init__(self, vehicle_id, heartbeat_queue, congestion_queue, max_window_size=5):
-        super().__init__()
-        self.vehicle_id = vehicle_id
-        self.heartbeat_queue = heartbeat_queue
-        self.congestion_queue = congestion_queue
-        self.cwnd = 1
-        self.ssthresh = max_window_size // 2
-        self.max_window_size = max_window_size
-        self.position = 0
-        self.speed = random.uniform(40, 60) 
-        self.synchronized = False
-        self.running = True
+def latest_heartbeat(heartbeat_queue, heartbeat):
+    """ Drain any heartbeats queued behind `heartbeat` and keep only the newest one """
+    while not heartbeat_queue.empty():
+        heartbeat = heartbeat_queue.get_nowait()
+    return heartbeat
+
+def collect_heartbeats(inboxes):
+    """ Take the newest waiting heartbeat from every inbox, as arrays indexed by vehicle id """
+    received = np.zeros(len(inboxes), dtype=bool)
+    heartbeat_speeds = np.zeros(len(inboxes), dtype=np.float32)
+    heartbeat_syncs = np.zeros(len(inboxes), dtype=bool)
+
+    for vehicle_id, inbox in enumerate(inboxes):
+        if inbox.empty():
+            logger.debug("Vehicle %s: No heartbeat received. Trying to resynchronize.", vehicle_id)
+            continue
+        heartbeat = latest_heartbeat(inbox, inbox.get_nowait())
+        logger.debug("Vehicle %s received heartbeat: %s", vehicle_id, heartbeat['binary_message'])
+        received[vehicle_id] = True
+        heartbeat_speeds[vehicle_id] = heartbeat["speed"]
+        heartbeat_syncs[vehicle_id] = heartbeat["sync"]
+
+    return received, heartbeat_speeds, heartbeat_syncs
+
+def make_tick(max_speed):
+    """ Build the per-tick kernel with this run's speed limit bound as a closure constant """
+    def tick(positions, speeds, synchronized, leaders, directions, received, heartbeat_speeds, heartbeat_syncs,
+             decisions, speed_changes, turn_distances):
+        """ Advance every vehicle by one second of driving in a single vectorized pass """
+        following = leaders != NO_LEADER
+        leader_speeds = speeds[np.where(following, leaders, 0)]
+
+        # A synchronising heartbeat sets the speed outright, unless there is a leader to follow
+        sync = received & heartbeat_syncs
+        synchronized |= sync
+        speeds[sync] = np.minimum(heartbeat_speeds[sync], max_speed)
+        speeds[sync & following] = leader_speeds[sync & following]
+
+        # Everyone else copies their leader until synchronised, or drifts if they have none
+        drift = ~sync
+        copy_leader = drift & following & ~synchronized
+        speeds[copy_leader] = leader_speeds[copy_leader]
+        wander = drift & ~following
+        speeds[wander] = np.clip(speeds[wander] + speed_changes[wander], 10, max_speed)
+        positions += speeds
+
+        # At an intersection go straight through, turn, or yield; elsewhere keep driving
+        at_intersection = decisions[:, AT_INTERSECTION]
+        turning = at_intersection & (directions != STRAIGHT)
+        can_turn = decisions[:, CAN_TURN]
+        turned = turning & can_turn
+        positions[turned] += turn_distances[turned]
+        speeds[turning & ~can_turn] = 0
+        positions[~at_intersection] += speeds[~at_intersection]
+
+    return tick
+
+class Platoon:
+    """ Struct-of-arrays state for every vehicle in the platoon, indexed by vehicle id """
+
+    def __init__(self, num_vehicles, max_window_size=5, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.inboxes = [asyncio.Queue() for _ in range(num_vehicles)]
+        self.heartbeat_tick = asyncio.Event()
+        self.positions = np.zeros(num_vehicles, dtype=np.float32)
+        self.speeds = self.rng.uniform(40, 60, num_vehicles).astype(np.float32)
+        self.cwnd = np.ones(num_vehicles, dtype=np.int32)
+        self.ssthresh = np.full(num_vehicles, max_window_size // 2, dtype=np.int32)
+        self.synchronized = np.zeros(num_vehicles, dtype=bool)
+        self.directions = np.full(num_vehicles, STRAIGHT, dtype=np.int8)
+        self.leaders = np.full(num_vehicles, NO_LEADER, dtype=np.intp)
+        self.followers = defaultdict(list)  # leader id -> ids of the vehicles following it
+        self.direction_groups = {direction: np.flatnonzero(self.directions == direction) for direction in range(len(DIRECTIONS))}
+        self.last_turn_time = np.zeros(num_vehicles)
         self.obstacle_detected = False
-        self.direction = "straight" 
-        self.leader = None 
-        self.last_turn_time = time.time() 
-
-        speed_data[self.vehicle_id] = []
-        position_data[self.vehicle_id] = []
-        resync_time_data[self.vehicle_id] = []
-        cwnd_data[self.vehicle_id] = []
-
-    def run(self):
-        while self.running:
-            time_step = time.time()
+        self.running = True
+        self.speed_sum = np.zeros(num_vehicles)
+        self.samples = 0
+        self._tick = 0
+        self._time_log = np.empty(TICKS)
+        self._speed_log = np.empty((TICKS, num_vehicles), dtype=np.float32)
+        self._pos_log = np.empty((TICKS, num_vehicles), dtype=np.float32)
+
+        # Every random choice for the whole run, drawn up front and indexed by tick
+        self.decisions = self.rng.random((TICKS, num_vehicles, len(DECISION_PROBABILITIES))) < DECISION_PROBABILITIES
+        self.speed_changes = self.rng.uniform(-5, 5, (TICKS, num_vehicles))
+        self.turn_distances = self.rng.uniform(5, 10, (TICKS, num_vehicles))
+
+        for vehicle_id in range(num_vehicles):
+            resync_time_data[vehicle_id] = []
+            cwnd_data[vehicle_id] = []
+
+    def __len__(self):
+        return len(self.positions)
+
+    async def run(self, tick):
+        # The state arrays are only ever updated in place, so bind them once for the whole run
+        heartbeat_tick, inboxes = self.heartbeat_tick, self.inboxes
+        positions, speeds, synchronized = self.positions, self.speeds, self.synchronized
+        leaders, directions, last_turn_time = self.leaders, self.directions, self.last_turn_time
+        all_decisions, speed_changes, turn_distances = self.decisions, self.speed_changes, self.turn_distances
+        log_metrics, detect_obstacle = self.log_metrics, self.detect_obstacle
+
+        while self._tick < TICKS:
+            # Wake when the sender's batch of heartbeats lands instead of on a timer of our own
+            await heartbeat_tick.wait()
+            heartbeat_tick.clear()
+            if not self.running:
+                break
+
+            current = self._tick
+            time_step = current * TIME_STEP
+            decisions = all_decisions[current]
             if self.obstacle_detected:
                 self.handle_obstacle()
-                continue
-
-            if time_step - self.last_turn_time >= TURN_FREQUENCY:
-                if self.wants_to_turn():
-                    self.assign_leader()
-                    self.last_turn_time = time_step 
-
-            try:
-                priority, heartbeat = self.heartbeat_queue.get(timeout=1)
-                print(f"Vehicle {self.vehicle_id} received priority {priority} heartbeat: {heartbeat['binary_message']}")
-                self.process_heartbeat(heartbeat)
-
-            except queue.Empty:
-                print(f"Vehicle {self.vehicle_id}: No heartbeat received. Trying to resynchronize.")
-                self.adjust_speed()
-
-            self.handle_intersection()
-            self.log_metrics(time_step)
-            self.detect_obstacle()  
-
-            time.sleep(1)  
-
-    def wants_to_turn(self):
-        """ Determine if the vehicle wants to turn (right or left) """
-        return random.random() < 0.3 
-
-    def assign_leader(self):
-        """ Assign a leader for the direction the vehicle wants to turn """
-        vehicles_in_direction = [v for v in vehicles if v.direction == self.direction and v.position > self.position]
-
-        if vehicles_in_direction:
-            self.leader = max(vehicles_in_direction, key=lambda v: v.position)  
-            print(f"Vehicle {self.vehicle_id} has assigned leader: Vehicle {self.leader.vehicle_id} for direction {self.direction}.")
-            self.update_following_speed() 
-            for vehicle in vehicles:
-                if vehicle != self and vehicle.leader == self.leader:
-                    vehicle.speed = self.leader.speed 
-
-    def update_following_speed(self):
-        """ Adjust the speed of this vehicle to not exceed the leader's speed """
-        if self.leader:
-            self.speed = self.leader.speed  
-            print(f"Vehicle {self.vehicle_id}: Adjusted speed to follow leader {self.leader.vehicle_id}: {self.speed:.2f} km/h")
-
-    def adjust_speed(self):
-        """ Adjust speed according to leader if one is assigned """
-        if self.leader:
-            if not self.synchronized:
-                self.speed = self.leader.speed
-                print(f"Vehicle {self.vehicle_id}: Adjusting speed to follow leader {self.leader.vehicle_id}.")
-        else:
-            change = random.uniform(-5, 5)
-            self.speed = max(10, min(self.speed + change, MAX_SPEED))
-
-        self.position += self.speed
-        print(f"Vehicle {self.vehicle_id}: Adjusting speed to {self.speed:.2f} km/h.")
-
-    def process_heartbeat(self, heartbeat):
-        """ Process the received heartbeat without error checks. """
-        if heartbeat["sync"]:
-            self.synchronized = True
-            self.speed = min(int(heartbeat["binary_message"], 2), MAX_SPEED)  
-            self.update_following_speed() 
-            self.position += self.speed
-        else:
-            self.adjust_speed()
-
-    def detect_obstacle(self):
+
+            wants_to_turn = (time_step - last_turn_time >= TURN_FREQUENCY) & decisions[:, WANTS_TO_TURN]
+            if wants_to_turn.any():
+                self.assign_leaders(wants_to_turn)
+                last_turn_time[wants_to_turn] = time_step
+
+            received, heartbeat_speeds, heartbeat_syncs = collect_heartbeats(inboxes)
+            tick(positions, speeds, synchronized, leaders, directions,
+                 received, heartbeat_speeds, heartbeat_syncs,
+                 decisions, speed_changes[current], turn_distances[current])
+            logger.debug("Speeds %s km/h, positions %s", speeds, positions)
+
+            log_metrics(time_step)
+            detect_obstacle(decisions)
+
+            self._tick += 1
+
+    def assign_leaders(self, wants_to_turn):
+        """ Point each turning vehicle at the front-most vehicle ahead of it in its direction """
+        positions = self.positions
+        for vehicle_id in np.flatnonzero(wants_to_turn).tolist():
+            same_direction = self.direction_groups[int(self.directions[vehicle_id])]
+            front = int(same_direction[np.argmax(positions[same_direction])])
+            if positions[front] > positions[vehicle_id]:
+                previous = int(self.leaders[vehicle_id])
+                if previous != NO_LEADER:
+                    self.followers[previous].remove(vehicle_id)
+                self.leaders[vehicle_id] = front
+                self.followers[front].append(vehicle_id)
+                self.speeds[self.followers[front]] = self.speeds[front]
+                logger.debug("Vehicle %s has assigned leader: Vehicle %s for direction %s.", vehicle_id, front, DIRECTIONS[self.directions[vehicle_id]])
+
+    def detect_obstacle(self, decisions):
         """ Simulate obstacle detection logic with reduced frequency """
-        if not self.obstacle_detected and random.random() < 0.05:  
+        spotted = np.flatnonzero(decisions[:, SPOTS_OBSTACLE])
+        if spotted.size:
             self.obstacle_detected = True
-            print(f"Vehicle {self.vehicle_id}: Obstacle detected! Initiating emergency procedures.")
+            logger.debug("Vehicle %s: Obstacle detected! Initiating emergency procedures.", spotted[0])
 
     def handle_obstacle(self):
-        """ Handle the detected obstacle by decelerating and notifying others """
-        if self.speed > 0:  
-            print(f"Vehicle {self.vehicle_id}: Decelerating due to obstacle.")
-            self.speed = max(0, self.speed - 10)  
-
-            for vehicle in vehicles:
-                if vehicle != self:
-                    vehicle.obstacle_detected = True
-                    print(f"Vehicle {vehicle.vehicle_id}: Notified of obstacle by Vehicle {self.vehicle_id}.")
-        else:
-            self.obstacle_detected = False 
-
-    def handle_intersection(self):
-        """ Handle intersections and decide whether to stop or turn """
-        if self.at_intersection():
-            if self.direction == "straight":
-                print(f"Vehicle {self.vehicle_id}: Proceeding straight through the intersection.")
-            elif self.direction in ["left", "right"]:
-                if self.can_turn():
-                    print(f"Vehicle {self.vehicle_id}: Turning {self.direction}.")
-                    self.position += self.turn_distance() 
-                else:
-                    print(f"Vehicle {self.vehicle_id}: Yielding at the intersection.")
-                    self.speed = 0  
-        else:
-            self.position += self.speed
-
-    def at_intersection(self):
-        """ Check if the vehicle is approaching an intersection. Placeholder logic. """
-        return random.random() < 0.2  
-
-    def can_turn(self):
-        """ Determine if the vehicle can turn left or right. Placeholder logic. """
-        return random.choice([True, False])  
-
-    def turn_distance(self):
-        """ Calculate the distance moved during a turn. Placeholder logic. """
-        return random.uniform(5, 10) 
+        """ Bring the whole platoon to a stop for the obstacle, then clear it """
+        # Braking takes no simulated time; the rest of the tick drives on from a standstill
+        self.speeds.fill(0)
+        self.obstacle_detected = False
+        logger.debug("All vehicles stopped, obstacle cleared.")
 
     def stop(self):
         self.running = False
+        self.heartbeat_tick.set()
 
     def log_metrics(self, time_step):
         """ Logs performance metrics for each time step """
-        with metrics_lock:  
-            if not time_data or time_data[-1] < time_step:
-                time_data.append(time_step)
-            
-            speed_data[self.vehicle_id].append(self.speed)
-            position_data[self.vehicle_id].append(self.position)
+        if LOG_HISTORY:
+            self._time_log[self.samples] = time_step
+            self._speed_log[self.samples] = self.speeds
+            self._pos_log[self.samples] = self.positions
+        self.speed_sum += self.speeds
+        self.samples += 1
 
 def run_simulation():
     """ Main simulation function to start the vehicles and manage the lead vehicle. """
-    congestion_queue = queue.Queue()
-
-    global vehicles  
-    vehicles = [Vehicle(vehicle_id=i, heartbeat_queue=queue.PriorityQueue(), congestion_queue=congestion_queue) for i in range(5)]
-
-    for vehicle in vehicles:
-        vehicle.start()
+    rng = np.random.default_rng()
+    tick = make_tick(MAX_SPEED)
 
-    def send_heartbeat():
+    async def send_heartbeat(platoon):
         while True:
-            for vehicle in vehicles:
-                binary_message = int_to_binary_string(random.randint(0, MAX_SPEED), bits=8)
-                sync = random.choice([True, False])  
-                heartbeat = {
-                    "binary_message": binary_message,
+            # Draw the whole tick's worth of heartbeats at once, then hand them out
+            speeds = rng.integers(0, MAX_SPEED, size=len(platoon), endpoint=True).tolist()
+            syncs = (rng.random(len(platoon)) < 0.5).tolist()
+            heartbeats = [
+                {
+                    "speed": speed,
+                    "binary_message": int_to_binary_string(speed, bits=8),
                     "sync": sync,
-                    "age": 0  
                 }
-                priority = random.randint(1, 5) + (heartbeat["age"] // AGING_FACTOR)  
-                vehicle.heartbeat_queue.put((priority, heartbeat))  
-            time.sleep(1)
-
-    threading.Thread(target=send_heartbeat, daemon=True).start()
-
-    try:
-        time.sleep(5)  
-    finally:
-        for vehicle in vehicles:
-            vehicle.stop()
-        for vehicle in vehicles:
-            vehicle.join()
+                for speed, sync in zip(speeds, syncs)
+            ]
+            for inbox, heartbeat in zip(platoon.inboxes, heartbeats):
+                inbox.put_nowait(heartbeat)  
+            platoon.heartbeat_tick.set()
+            await asyncio.sleep(TIME_STEP)
+
+    async def simulate():
+        platoon = Platoon(5)
+        sender = asyncio.create_task(send_heartbeat(platoon))
+        driver = asyncio.create_task(platoon.run(tick))
+        try:
+            await asyncio.sleep(SIMULATION_TIME)  
+        finally:
+            platoon.stop()
+            await driver
+            sender.cancel()
+        return platoon
+
+    platoon = asyncio.run(simulate())
+
+    if LOG_HISTORY:
+        merge_metrics(platoon)
 
     # Performance metrics collection
-    average_speed = sum([sum(speeds) for speeds in speed_data.values()]) / sum([len(speeds) for speeds in speed_data.values()]) if speed_data else 0
-    total_distance = sum([vehicle.position for vehicle in vehicles])
+    average_speed = float(platoon.speed_sum.sum()) / max(1, platoon.samples * len(platoon))
+    total_distance = float(platoon.positions.sum())
 
     print(f"Average Speed: {average_speed:.2f} km/h")
     print(f"Total Distance Travelled: {total_distance:.2f} km")
@@ -222,6 +266,15 @@ def run_simulation():
         "Total Distance": total_distance,
     }
 
+def merge_metrics(platoon):
+    """ Split the per-tick snapshots into per-vehicle series once the platoon has stopped """
+    speeds = platoon._speed_log[:platoon.samples]
+    positions = platoon._pos_log[:platoon.samples]
+    for vehicle_id in range(len(platoon)):
+        speed_data[vehicle_id] = speeds[:, vehicle_id].tolist()
+        position_data[vehicle_id] = positions[:, vehicle_id].tolist()
+    time_data[:] = platoon._time_log[:platoon.samples].tolist()
+
 def compare_performance(normal_results, modified_results):
     """ Compare the performance of two different platooning methods. """
     categories = ['Average Speed', 'Total Distance']
@@ -1,11 +1,15 @@
-import threading
-import time
-import random
+import asyncio
 import matplotlib.pyplot as plt
+import numpy as np
 
 NUM_VEHICLES = 5
 TIME_STEP = 1     
 SIMULATION_TIME = 20  
+TICKS = SIMULATION_TIME // TIME_STEP
+
+# Slots in the block of random numbers each vehicle draws once per tick
+DELIVERY_DRAW, ERROR_DRAW, CORRECTION_DRAW, FLUCTUATION_DRAW, LATENCY_DRAW = range(5)
+DRAWS_PER_TICK = 5
 
 time_data = []
 throughput_data = [[] for _ in range(NUM_VEHICLES)]  
@@ -13,134 +17,163 @@ heartbeat_delivery_data = [[] for _ in range(NUM_VEHICLES)]
 error_correction_data = [[] for _ in range(NUM_VEHICLES)]  
 packet_loss_data = [[] for _ in range(NUM_VEHICLES)]  
 latency_data = [[] for _ in range(NUM_VEHICLES)]  # New latency data
-metrics_lock = threading.Lock()
 
-class Vehicle(threading.Thread):
-    def __init__(self, vehicle_id):
-        super().__init__()
+class Vehicle:
+    def __init__(self, vehicle_id, seed=None):
         self.vehicle_id = vehicle_id
+        self._rng = np.random.default_rng(seed)
+        self._draws = self._rng.random(DRAWS_PER_TICK).tolist()
         self.running = True
         self.heartbeat_count = 0
         self.heartbeat_received = 0
         self.errors_detected = 0
         self.errors_corrected = 0
-        self.base_throughput = random.randint(5, 10)
+        self.base_throughput = int(self._rng.integers(5, 10, endpoint=True))
         self.packet_loss_count = 0  
-    def run(self):
-        while self.running:
-            self.send_heartbeat()
-
-            with metrics_lock:
-                fluctuation = random.randint(-2, 2) 
-                self.heartbeat_count += self.base_throughput + fluctuation
-                throughput_data[self.vehicle_id].append(max(self.heartbeat_count, 0))
-
-                heartbeat_delivery_ratio = (self.heartbeat_received / (self.heartbeat_count + 1e-6))
-                heartbeat_delivery_data[self.vehicle_id].append(heartbeat_delivery_ratio)
-
-                error_correction_ratio = (self.errors_corrected / (self.errors_detected + 1e-6))
-                error_correction_data[self.vehicle_id].append(error_correction_ratio)
-
-                dropped_messages = self.heartbeat_count - self.heartbeat_received
-                self.packet_loss_count += dropped_messages
-                packet_loss_ratio = self.packet_loss_count / (self.heartbeat_count + 1e-6) 
-                packet_loss_data[self.vehicle_id].append(packet_loss_ratio)
-
-                # Simulate latency as a random value influenced by throughput
-                latency = random.uniform(0.1, 0.5) + (1.0 / (self.base_throughput + 1e-6))  # More throughput = less latency
-                latency_data[self.vehicle_id].append(latency)
-
-                current_time = len(throughput_data[self.vehicle_id]) * TIME_STEP
-                if not time_data or current_time > time_data[-1]:
-                    time_data.append(current_time)
-
-            time.sleep(TIME_STEP)
+        self._tick = 0
+        self._throughput_log = np.empty(TICKS, dtype=np.int64)
+        self._delivery_log = np.empty(TICKS)
+        self._correction_log = np.empty(TICKS)
+        self._packet_loss_log = np.empty(TICKS)
+        self._latency_log = np.empty(TICKS)
+
+    async def run(self):
+        # Bind what the loop reads every tick; the log arrays are only written in place
+        draw = self._rng.random
+        send_heartbeat = self.send_heartbeat
+        base_throughput = self.base_throughput
+        throughput_log, delivery_log = self._throughput_log, self._delivery_log
+        correction_log, packet_loss_log, latency_log = self._correction_log, self._packet_loss_log, self._latency_log
+
+        while self.running and self._tick < TICKS:
+            tick = self._tick
+            self._draws = draws = draw(DRAWS_PER_TICK).tolist()
+            send_heartbeat()
+
+            fluctuation = int(draws[FLUCTUATION_DRAW] * 5) - 2 
+            self.heartbeat_count += base_throughput + fluctuation
+            throughput_log[tick] = max(self.heartbeat_count, 0)
+
+            heartbeat_delivery_ratio = (self.heartbeat_received / (self.heartbeat_count + 1e-6))
+            delivery_log[tick] = heartbeat_delivery_ratio
+
+            error_correction_ratio = (self.errors_corrected / (self.errors_detected + 1e-6))
+            correction_log[tick] = error_correction_ratio
+
+            dropped_messages = self.heartbeat_count - self.heartbeat_received
+            self.packet_loss_count += dropped_messages
+            packet_loss_ratio = self.packet_loss_count / (self.heartbeat_count + 1e-6) 
+            packet_loss_log[tick] = packet_loss_ratio
+
+            # Simulate latency as a random value influenced by throughput
+            latency = 0.1 + draws[LATENCY_DRAW] * 0.4 + (1.0 / (base_throughput + 1e-6))  # More throughput = less latency
+            latency_log[tick] = latency
+            self._tick += 1
+
+            await asyncio.sleep(TIME_STEP)
 
     def send_heartbeat(self):
         """ Simulate sending a heartbeat with a chance of error. """
         self.heartbeat_count += 1
-        if random.random() < 0.9:  
+        if self._draws[DELIVERY_DRAW] < 0.9:  
             self.heartbeat_received += 1
             
-            if random.random() < 0.1: 
+            if self._draws[ERROR_DRAW] < 0.1: 
                 self.errors_detected += 1
-                if random.random() < 0.5:
+                if self._draws[CORRECTION_DRAW] < 0.5:
                     self.errors_corrected += 1
 
     def stop(self):
         self.running = False
 
+def merge_metrics(vehicles):
+    """ Collect the per-vehicle metric buffers once every vehicle has stopped. """
+    # Trim to the ticks every vehicle completed so the series stack into one array
+    ticks = min(vehicle._tick for vehicle in vehicles)
+    for vehicle in vehicles:
+        throughput_data[vehicle.vehicle_id] = vehicle._throughput_log[:ticks]
+        heartbeat_delivery_data[vehicle.vehicle_id] = vehicle._delivery_log[:ticks]
+        error_correction_data[vehicle.vehicle_id] = vehicle._correction_log[:ticks]
+        packet_loss_data[vehicle.vehicle_id] = vehicle._packet_loss_log[:ticks]
+        latency_data[vehicle.vehicle_id] = vehicle._latency_log[:ticks]
+    time_data[:] = (np.arange(1, ticks + 1) * TIME_STEP).tolist()
+
 def run_simulation():
     """ Main simulation function to start the vehicles. """
     global vehicles
     vehicles = [Vehicle(vehicle_id=i) for i in range(NUM_VEHICLES)]
 
-    for vehicle in vehicles:
-        vehicle.start()
+    async def simulate():
+        runs = asyncio.gather(*[vehicle.run() for vehicle in vehicles])
+        await asyncio.sleep(SIMULATION_TIME)
 
-    time.sleep(SIMULATION_TIME)
+        for vehicle in vehicles:
+            vehicle.stop()
+        await runs
 
-    for vehicle in vehicles:
-        vehicle.stop()
-    for vehicle in vehicles:
-        vehicle.join()
+    asyncio.run(simulate())
+
+    merge_metrics(vehicles)
+
+    # One (ticks, vehicles) array per metric, so each subplot is a single plot call
+    throughput = np.asarray(throughput_data).T
+    heartbeat_delivery = np.asarray(heartbeat_delivery_data).T
+    error_correction = np.asarray(error_correction_data).T
+    packet_loss = np.asarray(packet_loss_data).T
+    latency = np.asarray(latency_data).T
+    labels = [f'Vehicle {i}' for i in range(NUM_VEHICLES)]
 
     plt.figure(figsize=(12, 12))
 
     # 1. Throughput vs Time
     plt.subplot(3, 2, 1)
-    for i in range(NUM_VEHICLES):
-        plt.plot(time_data, throughput_data[i], label=f'Vehicle {i}', marker='') 
+    lines = plt.plot(time_data, throughput)
     plt.xlabel('Time (s)')
     plt.ylabel('Throughput (Heartbeat Count)')
     plt.title('Throughput vs Time')
     plt.xlim(0, SIMULATION_TIME)
-    plt.legend()
+    plt.legend(lines, labels)
     plt.grid()
 
     # 2. Heartbeat Reception Ratio vs Time
     plt.subplot(3, 2, 2)
-    for i in range(NUM_VEHICLES):
-        plt.plot(time_data, heartbeat_delivery_data[i], label=f'Vehicle {i}', marker='')  
+    lines = plt.plot(time_data, heartbeat_delivery)
     plt.xlabel('Time (s)')
     plt.ylabel('Reception Ratio')
     plt.title('Heartbeat Reception Ratio vs Time')
     plt.xlim(0, SIMULATION_TIME)
-    plt.legend()
+    plt.legend(lines, labels)
     plt.grid()
 
     # 3. Error Correction Ratio vs Time
     plt.subplot(3, 2, 3)
-    for i in range(NUM_VEHICLES):
-        plt.plot(time_data, error_correction_data[i], label=f'Vehicle {i}', marker='')  
+    lines = plt.plot(time_data, error_correction)
     plt.xlabel('Time (s)')
     plt.ylabel('Correction Ratio')
     plt.title('Error Correction Ratio vs Time')
     plt.xlim(0, SIMULATION_TIME)
-    plt.legend()
+    plt.legend(lines, labels)
     plt.grid()
 
     # 4. Packet delivery vs Number of Messages Sent
     plt.subplot(3, 2, 4)
-    for i in range(NUM_VEHICLES):
-        plt.plot(range(1, len(packet_loss_data[i]) + 1), packet_loss_data[i], label=f'Vehicle {i}', marker='')  
+    lines = plt.plot(range(1, len(packet_loss) + 1), packet_loss)
     plt.xlabel('Number of Messages Sent')
     plt.ylabel('Packet Delivery Ratio')
     plt.title('Packet Delivery vs Number of Messages Sent')
     plt.xlim(0, SIMULATION_TIME)
     plt.xticks(range(0, 11, 2))  
-    plt.legend()
+    plt.legend(lines, labels)
     plt.grid()
 
     # 5. Latency vs Time
     plt.subplot(3, 2, 5)
-    for i in range(NUM_VEHICLES):
-        plt.plot(time_data, latency_data[i], label=f'Vehicle {i}', marker='')  
+    lines = plt.plot(time_data, latency)
     plt.xlabel('Time (s)')
     plt.ylabel('Latency (s)')
     plt.title('Heartbeat Latency vs Time')
     plt.xlim(0, SIMULATION_TIME)
-    plt.legend()
+    plt.legend(lines, labels)
     plt.grid()
 
     plt.tight_layout()  
@@ -1,14 +1,47 @@
-import threading
-import queue
+import asyncio
+import atexit
+import heapq
+import itertools
 import time
+import logging
+import logging.handlers
+import queue
 import random
 import matplotlib.pyplot as plt
-
-SINGLE_BIT = 1
-DOUBLE_BIT = 2
-BURST = 3
+import numpy as np
+
+try:
+    # Optional: hands the run's metrics over as a columnar table
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Log records are queued and written out by a background thread, so a debug run
+# doesn't stall each tick on terminal I/O
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+logging.basicConfig(level=logging.WARNING, handlers=[logging.handlers.QueueHandler(log_queue)])
+# The queue handler stays on the root logger for the life of the process, so the listener does too
+log_listener.start()
+atexit.register(log_listener.stop)
+logger = logging.getLogger(__name__)
+
+# Error types double as row indices into Platoon.errors; None means no error
+SINGLE_BIT, DOUBLE_BIT, BURST = range(3)
 
 MAX_SPEED = 120  
+TIME_STEP = 1
+VIRTUAL_TIME = True  # advance a simulated clock instead of sleeping through each tick
+METRICS_PARQUET = None  # path to save the run's metrics table to, e.g. "metrics.parquet" (needs pyarrow)
+STRAIGHT, LEFT, RIGHT = range(3)
+DIRECTIONS = ["straight", "left", "right"]
+NO_LEADER = -1
+
+# Slots in the block of random numbers each vehicle draws per tick
+TURN_DRAW, DRIFT_DRAW, INTERSECTION_DRAW, CAN_TURN_DRAW, DIRECTION_DRAW, OBSTACLE_DRAW = range(6)
+DRAWS_PER_TICK = 6
+DRAW_BLOCK = 64  # ticks' worth of draws generated in one call
 
 time_data = []
 speed_data = {}
@@ -16,268 +49,402 @@ position_data = {}
 error_data = {SINGLE_BIT: [], DOUBLE_BIT: [], BURST: []}
 resync_time_data = {}
 cwnd_data = {}
-metrics_lock = threading.Lock()
-
-def int_to_binary_string(n, bits=8):
-    """ Convert integer to binary string representation """
-    return f"{n:0{bits}b}"
-
-class AgedPriorityQueue(queue.PriorityQueue):
-    """ Custom priority queue that ages entries to prevent starvation """
-    
-    def __init__(self, maxsize=0):
-        super().__init__(maxsize)
-        self.age_factor = 1  
-
-    def put(self, item, block=True, timeout=None):
+metrics_table = None
+
+# Heartbeats show up in the logs as 8-bit strings; render them by lookup
+_BIN8 = [f"{i:08b}" for i in range(256)]
+
+def flip_bit(value, index):
+    """ Flip the bit at a given index, counting from the most significant bit """
+    return value ^ (1 << (7 - index))
+
+def _single_bit_fix(value, expected_parity):
+    """ First single-bit flip of value that restores the expected parity, or None if it already matches """
+    if PARITY[value] == expected_parity:
+        return None
+    for i in range(8):
+        flipped_value = flip_bit(value, i)
+        if PARITY[flipped_value] == expected_parity:
+            return flipped_value
+
+# Every heartbeat is 8 bits, so parity and single-bit repair are both table lookups;
+# SINGLE_BIT_FIX is indexed by (value << 1) | expected_parity
+PARITY = bytes(i.bit_count() & 1 for i in range(256))
+PARITY_ARRAY = np.frombuffer(PARITY, np.uint8)  # same table, for indexing whole batches
+SINGLE_BIT_FIX = tuple(_single_bit_fix(key >> 1, key & 1) for key in range(512))
+
+class HeartbeatQueue:
+    """ Priority queue that serves equal priorities first in, first out """
+
+    # Nothing ever blocks on this queue: the sender pushes and the platoon drains it
+    # once per tick on the same event loop, so a bare heap needs no locks or waiters
+    def __init__(self):
+        self._heap = []
+        # Arrival order breaks priority ties, so heartbeat dicts are never compared
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put(self, item):
         priority, heartbeat = item
-        age_adjusted_priority = max(1, priority - self.age_factor)
-        super().put((age_adjusted_priority, heartbeat), block, timeout)
-
-    def increase_age(self):
-        """ Function to increase the aging factor over time """
-        self.age_factor += 1
-
-class Vehicle(threading.Thread):
-    def __init__(self, vehicle_id, heartbeat_queue, congestion_queue, max_window_size=5):
-        super().__init__()
-        self.vehicle_id = vehicle_id
+        heapq.heappush(self._heap, (priority, next(self._seq), heartbeat))
+
+    def get(self):
+        priority, _, heartbeat = heapq.heappop(self._heap)
+        return priority, heartbeat
+
+def make_step(max_speed):
+    """ Build the per-tick speed and position kernel with the speed limit bound in """
+    def step(speeds, positions, synchronized, leaders, synced, held, values, speed_changes, waiting,
+             speed_out, position_out):
+        # Without a sync heartbeat a vehicle follows its leader, or drifts within the limits
+        following = leaders != NO_LEADER
+        new_speeds = np.where(following, speeds[leaders], np.clip(speeds + speed_changes, 10, max_speed))
+        new_speeds = np.where(synced, np.minimum(values, max_speed), new_speeds)
+        # A heartbeat that could not be corrected leaves its vehicle untouched this tick
+        moving = ~held
+        speeds[moving] = new_speeds[moving]
+        positions[moving] += speeds[moving]
+        synchronized |= synced
+        # Vehicles held up at an intersection stop where they got to
+        speeds[waiting] = 0
+        # Write the tick's history row while the state is at hand
+        speed_out[:] = speeds
+        position_out[:] = positions
+    return step
+
+class Platoon:
+    """ Every vehicle's state as parallel arrays indexed by vehicle id, advanced together each tick """
+
+    def __init__(self, num_vehicles, heartbeat_queue, congestion_queue, max_window_size=5, max_steps=16, seed=None):
+        self.rng = np.random.default_rng(seed)
         self.heartbeat_queue = heartbeat_queue
         self.congestion_queue = congestion_queue
-        self.cwnd = 1
-        self.ssthresh = max_window_size // 2
         self.max_window_size = max_window_size
-        self.position = 0
-        self.speed = random.uniform(40, 60)  
-        self.synchronized = False
-        self.running = True
+        self.cwnd = np.ones(num_vehicles, dtype=np.int32)
+        self.ssthresh = np.full(num_vehicles, max_window_size // 2, dtype=np.int32)
+        self.positions = np.zeros(num_vehicles, dtype=np.float32)
+        self.speeds = self.rng.uniform(40, 60, num_vehicles).astype(np.float32)
+        self.synchronized = np.zeros(num_vehicles, dtype=bool)
         self.obstacle_detected = False
-        self.direction = random.choice(["straight", "left", "right"])  
-        self.leader = None
-        speed_data[self.vehicle_id] = []
-        position_data[self.vehicle_id] = []
-        error_data[SINGLE_BIT].append(0)
-        error_data[DOUBLE_BIT].append(0)
-        error_data[BURST].append(0)
-        resync_time_data[self.vehicle_id] = []
-        cwnd_data[self.vehicle_id] = []
-
-    def run(self):
+        self.directions = self.rng.integers(0, 3, num_vehicles).astype(np.int8)
+        self.leaders = np.full(num_vehicles, NO_LEADER, dtype=np.intp)
+        self.running = True
+        self._draws = np.empty((DRAW_BLOCK, num_vehicles, DRAWS_PER_TICK))
+        self._draw_tick = DRAW_BLOCK
+        self._next_receiver = 0
+        self._step = 0
+        self._time_log = np.empty(max_steps)
+        self._speed_log = np.empty((max_steps, num_vehicles), dtype=np.float32)
+        self._position_log = np.empty((max_steps, num_vehicles), dtype=np.float32)
+        self._cwnd_log = np.empty((max_steps, num_vehicles), dtype=np.int32)
+        self.errors = np.zeros((3, num_vehicles), dtype=np.int32)
+        # Bound once so each heartbeat goes straight to the handler for its error type
+        self._error_handlers = {
+            None: self.accept_heartbeat,
+            SINGLE_BIT: self.correct_single_bit_error,
+            DOUBLE_BIT: self.reject_double_bit_error,
+            BURST: self.correct_burst_error,
+        }
+        for vehicle_id in range(num_vehicles):
+            resync_time_data[vehicle_id] = []
+
+    def __len__(self):
+        return len(self.speeds)
+
+    async def run(self, step):
         while self.running:
-            time_step = time.time()
-            if self.obstacle_detected:
-                self.handle_obstacle()
-                continue
-            
-            if self.wants_to_turn():
-                self.assign_leader()
+            self.tick(step, time.time())
+            await asyncio.sleep(TIME_STEP)
 
-            try:
-                priority, heartbeat = self.heartbeat_queue.get(timeout=1)
-                print(f"Vehicle {self.vehicle_id} received priority {priority} heartbeat: {heartbeat['binary_message']}")
+    def process(self, step):
+        """ Simulated-time process for run_virtual: one tick per time step """
+        now = yield 0
+        while self.running:
+            self.tick(step, now)
+            now = yield TIME_STEP
 
-                if self.process_heartbeat(heartbeat):
-                    print(f"Vehicle {self.vehicle_id}: Corrected heartbeat: {heartbeat['binary_message']}")
+    def tick(self, step, time_step):
+        """ Advance every vehicle by one time step """
+        if self.obstacle_detected:
+            self.handle_obstacle()
 
-            except queue.Empty:
-                print(f"Vehicle {self.vehicle_id}: No heartbeat received. Trying to resynchronize.")
-                self.adjust_speed()
+        draws = self.next_draws()
+        wants_to_turn = draws[:, TURN_DRAW] < 0.5
+        if wants_to_turn.any():
+            self.assign_leaders(wants_to_turn)
 
-            self.handle_intersection()
+        synced, held, values = self.collect_heartbeats()
+        turned, waiting = self.check_intersection(draws)
+        row = self.log_metrics(time_step)
+        step(self.speeds, self.positions, self.synchronized, self.leaders,
+             synced, held, values, draws[:, DRIFT_DRAW] * 10 - 5, waiting,
+             self._speed_log[row], self._position_log[row])
+        logger.debug("Speeds %s km/h, positions %s", self.speeds, self.positions)
 
-            self.log_metrics(time_step)
+        # Turning drops the leader, which step() still had to follow this tick
+        if turned.any():
+            self.take_turns(turned, draws)
 
-            self.detect_obstacle() 
-            time.sleep(1)
+        self.detect_obstacle(draws)
 
     def stop(self):
-        """ Stop the vehicle thread. """
+        """ Stop the platoon task. """
         self.running = False
 
-    def wants_to_turn(self):
-        """ Determine if the vehicle wants to turn (right or left) """
-        return random.choice([True, False])  
-
-    def assign_leader(self):
-        """ Assign a leader for the direction the vehicle wants to turn """
-        vehicles_in_direction = [v for v in vehicles if v.direction == self.direction and v.position > self.position]
-
-        if vehicles_in_direction:
-            self.leader = max(vehicles_in_direction, key=lambda v: v.position) 
-            print(f"Vehicle {self.vehicle_id} has assigned leader: Vehicle {self.leader.vehicle_id} for direction {self.direction}.")
-
-    def adjust_speed(self):
-        """ Adjust speed according to leader if one is assigned """
-        if self.leader:
-            self.speed = self.leader.speed
-            print(f"Vehicle {self.vehicle_id}: Adjusting speed to follow leader {self.leader.vehicle_id}.")
-        else:
-            self.speed = max(10, min(self.speed + random.uniform(-5, 5), MAX_SPEED))
-        
-        self.position += self.speed
-        print(f"Vehicle {self.vehicle_id}: Adjusting speed to {self.speed:.2f} km/h.")
-
-    def process_heartbeat(self, heartbeat):
-        if self.detect_and_correct_errors(heartbeat):
-            if heartbeat["sync"] and self.running:
-                self.synchronized = True
-                self.speed = min(int(heartbeat["binary_message"], 2), MAX_SPEED) 
-                self.position += self.speed
+    def next_draws(self):
+        """ This tick's (vehicles, DRAWS_PER_TICK) slice of the pre-drawn random block """
+        if self._draw_tick == DRAW_BLOCK:
+            self.rng.random(out=self._draws)
+            self._draw_tick = 0
+        draws = self._draws[self._draw_tick]
+        self._draw_tick += 1
+        return draws
+
+    def assign_leaders(self, wants_to_turn):
+        """ Assign each turning vehicle the frontmost vehicle ahead of it heading the same way """
+        positions, directions = self.positions, self.directions
+        # The frontmost vehicle heading each way leads every vehicle behind it going the same way
+        for direction in np.unique(directions[wants_to_turn]):
+            in_direction = directions == direction
+            group = np.flatnonzero(in_direction)
+            front = group[positions[group].argmax()]
+            assigned = wants_to_turn & in_direction & (positions < positions[front])
+            if assigned.any():
+                self.leaders[assigned] = front
+                logger.debug("Vehicles %s have assigned leader: Vehicle %s for direction %s.", np.flatnonzero(assigned), front, DIRECTIONS[direction])
+
+    def collect_heartbeats(self):
+        """ Hand this tick's heartbeats out one per vehicle in turn and sort the vehicles by what they got """
+        num_vehicles = len(self)
+        synced = np.zeros(num_vehicles, dtype=bool)
+        held = np.zeros(num_vehicles, dtype=bool)
+        values = np.zeros(num_vehicles, dtype=np.float32)
+
+        batch = [self.heartbeat_queue.get() for _ in range(min(num_vehicles, len(self.heartbeat_queue)))]
+        if not batch:
+            return synced, held, values
+
+        # Check the parity of the whole batch in one pass; only mismatches need the repair table
+        batch_values = np.fromiter((heartbeat["value"] for _, heartbeat in batch), dtype=np.uint8, count=len(batch))
+        batch_parities = np.fromiter((heartbeat["parity"] for _, heartbeat in batch), dtype=np.uint8, count=len(batch))
+        parity_ok = (PARITY_ARRAY[batch_values] == batch_parities).tolist()
+
+        for (priority, heartbeat), heartbeat_parity_ok in zip(batch, parity_ok):
+            vehicle_id = self._next_receiver
+            self._next_receiver = (vehicle_id + 1) % num_vehicles
+            logger.debug("Vehicle %s received priority %s heartbeat: %s", vehicle_id, priority, _BIN8[heartbeat['value']])
+
+            if self.detect_and_correct_errors(vehicle_id, heartbeat, heartbeat_parity_ok):
+                logger.debug("Vehicle %s: Corrected heartbeat: %s", vehicle_id, _BIN8[heartbeat['value']])
+                if heartbeat["sync"] and self.running:
+                    synced[vehicle_id] = True
+                    values[vehicle_id] = heartbeat["value"]
             else:
-                self.adjust_speed()
-            return True
+                held[vehicle_id] = True
+        return synced, held, values
+
+    def detect_and_correct_errors(self, vehicle_id, heartbeat, parity_ok):
+        return self._error_handlers[heartbeat.get('error_type')](vehicle_id, heartbeat, parity_ok)
+
+    def accept_heartbeat(self, vehicle_id, heartbeat, parity_ok):
+        """ Nothing to correct """
+        return True
+
+    def reject_double_bit_error(self, vehicle_id, heartbeat, parity_ok):
+        """ Parity cannot locate two flipped bits, so the heartbeat is dropped """
+        self.errors[DOUBLE_BIT, vehicle_id] += 1
         return False
 
-    def detect_and_correct_errors(self, heartbeat):
-        error_type = heartbeat.get('error_type')
-
-        if error_type == SINGLE_BIT:
-            return self.correct_single_bit_error(heartbeat)
-        elif error_type == DOUBLE_BIT:
-            error_data[DOUBLE_BIT][self.vehicle_id] += 1
-            return False  
-        elif error_type == BURST:
-            error_data[BURST][self.vehicle_id] += 1
-            return self.correct_burst_error(heartbeat)
-        return True 
-
-    def correct_single_bit_error(self, heartbeat):
-        binary_message = heartbeat["binary_message"]
-        original_parity = heartbeat["parity"]
-        calculated_parity = binary_message.count('1') % 2
-
-        if original_parity != calculated_parity:
-            for i in range(len(binary_message)):
-                flipped_message = flip_bit(binary_message, i)
-                if flipped_message.count('1') % 2 == original_parity:
-                    heartbeat["binary_message"] = flipped_message
-                    print(f"Vehicle {self.vehicle_id}: Single-bit error detected and corrected.")
-                    error_data[SINGLE_BIT][self.vehicle_id] += 1
-                    return True
+    def correct_single_bit_error(self, vehicle_id, heartbeat, parity_ok):
+        if parity_ok:
+            return False
+        corrected = SINGLE_BIT_FIX[(heartbeat["value"] << 1) | heartbeat["parity"]]
+
+        if corrected is not None:
+            heartbeat["value"] = corrected
+            logger.debug("Vehicle %s: Single-bit error detected and corrected.", vehicle_id)
+            self.errors[SINGLE_BIT, vehicle_id] += 1
+            return True
         return False
 
-    def correct_burst_error(self, heartbeat):
+    def correct_burst_error(self, vehicle_id, heartbeat, parity_ok):
         """ Correct burst error using majority vote from redundant messages """
-        redundant_messages = heartbeat.get("redundant_messages", [heartbeat["binary_message"]])
+        self.errors[BURST, vehicle_id] += 1
+        redundant_messages = np.asarray(heartbeat.get("redundant_messages", [heartbeat["value"]]), dtype=np.uint8)
         
         if len(redundant_messages) < 3:  
             return False
         
-        majority_message = max(set(redundant_messages), key=redundant_messages.count)
+        # Vote bit by bit: a bit is set if more than half of the copies have it set
+        ones = np.unpackbits(redundant_messages[:, None], axis=1).sum(axis=0)
+        majority_message = int(np.packbits(ones * 2 > len(redundant_messages))[0])
         
-        if majority_message != heartbeat["binary_message"]:
-            print(f"Vehicle {self.vehicle_id}: Burst error corrected using redundancy.")
-            heartbeat["binary_message"] = majority_message
+        if majority_message != heartbeat["value"]:
+            logger.debug("Vehicle %s: Burst error corrected using redundancy.", vehicle_id)
+            heartbeat["value"] = majority_message
             return True
         
         return False 
 
-    def detect_obstacle(self):
+    def detect_obstacle(self, draws):
         """ Simulate obstacle detection logic with reduced frequency """
-        if not self.obstacle_detected and random.random() < 0.05:  
+        # A vehicle already standing still just clears the obstacle, so only a moving one raises the flag
+        spotted = (draws[:, OBSTACLE_DRAW] < 0.05) & (self.speeds > 0)
+        if spotted.any():
             self.obstacle_detected = True
-            print(f"Vehicle {self.vehicle_id}: Obstacle detected! Initiating emergency procedures.")
+            logger.debug("Vehicles %s: Obstacle detected! Initiating emergency procedures.", np.flatnonzero(spotted))
 
     def handle_obstacle(self):
         """ Handle the detected obstacle by decelerating and notifying others """
-        if self.speed > 0: 
-            print(f"Vehicle {self.vehicle_id}: Decelerating due to obstacle.")
-            self.speed = max(0, self.speed - 10)  
-            for vehicle in vehicles:
-                if vehicle != self and not vehicle.obstacle_detected:
-                    vehicle.obstacle_detected = True
-                    vehicle.speed = max(0, vehicle.speed - 10)
-                    print(f"Vehicle {vehicle.vehicle_id}: Decelerating to {vehicle.speed:.2f} km/h due to obstacle in front.")
-        else:
-            self.obstacle_detected = False  
-
-    def handle_intersection(self):
-        """ Handles the behavior of the vehicle at an intersection. """
-        if self.at_intersection():
-            if self.direction == "straight":
-                print(f"Vehicle {self.vehicle_id}: Proceeding straight through the intersection.")
-            elif self.direction in ["left", "right"]:
-                if self.can_turn():
-                    print(f"Vehicle {self.vehicle_id}: Turning {self.direction} at the intersection.")
-                    self.direction = random.choice(["straight", "left", "right"])  
-                    self.leader = None 
-                else:
-                    print(f"Vehicle {self.vehicle_id}: Waiting to turn {self.direction}.")
-                    self.speed = 0 
-
-    def at_intersection(self):
-        """ Simulate the detection of an intersection """
-        return random.random() < 0.1  
-
-    def can_turn(self):
-        """ Simulate whether the vehicle is able to turn """
-        return random.random() < 0.7
+        # The warning reaches every vehicle, and each brakes until it stands still
+        logger.debug("Decelerating all vehicles due to obstacle.")
+        self.speeds.fill(0)
+        self.obstacle_detected = False
 
-    def log_metrics(self, time_step):
-        with metrics_lock:
-            time_data.append(time_step)
-            speed_data[self.vehicle_id].append(self.speed)
-            position_data[self.vehicle_id].append(self.position)
-            cwnd_data[self.vehicle_id].append(self.cwnd)
+    def check_intersection(self, draws):
+        """ Decide which vehicles at an intersection turn this tick and which have to wait """
+        at_intersection = draws[:, INTERSECTION_DRAW] < 0.1
+        can_turn = draws[:, CAN_TURN_DRAW] < 0.7
+        turning = at_intersection & (self.directions != STRAIGHT)
 
-class HeartbeatSender(threading.Thread):
+        turned = turning & can_turn
+        waiting = turning & ~can_turn
+        if waiting.any():
+            logger.debug("Vehicles %s: Waiting to turn.", np.flatnonzero(waiting))
+        return turned, waiting
+
+    def take_turns(self, turned, draws):
+        """ Send the turning vehicles off in a new direction without a leader """
+        logger.debug("Vehicles %s: Turning at the intersection.", np.flatnonzero(turned))
+        self.directions[turned] = draws[turned, DIRECTION_DRAW] * 3
+        self.leaders[turned] = NO_LEADER
+
+    def log_metrics(self, time_step):
+        """ Claim this tick's history row; step() fills in the speeds and positions """
+        if self._step == len(self._time_log):
+            self._grow_logs()
+        row = self._step
+        self._time_log[row] = time_step
+        self._cwnd_log[row] = self.cwnd
+        self._step += 1
+        return row
+
+    def _grow_logs(self):
+        """ Double the buffers if the run outlasts the steps they were sized for """
+        size = 2 * len(self._time_log)
+        self._time_log = np.resize(self._time_log, size)
+        self._speed_log = np.resize(self._speed_log, (size, len(self)))
+        self._position_log = np.resize(self._position_log, (size, len(self)))
+        self._cwnd_log = np.resize(self._cwnd_log, (size, len(self)))
+
+class HeartbeatSender:
     def __init__(self, heartbeat_queue, interval=1):
-        super().__init__()
         self.heartbeat_queue = heartbeat_queue
         self.interval = interval
         self.running = True
 
-    def run(self):
+    async def run(self):
         while self.running:
-            time_step = time.time()
-            heartbeat = self.create_heartbeat_message()
-            self.heartbeat_queue.put((random.randint(1, 10), heartbeat))
-            print(f"Sent heartbeat: {heartbeat['binary_message']} at time {time_step}")
-            time.sleep(self.interval)
+            self.send(time.time())
+            await asyncio.sleep(self.interval)
+
+    def process(self):
+        """ Simulated-time process for run_virtual: one heartbeat per interval """
+        now = yield 0
+        while self.running:
+            self.send(now)
+            now = yield self.interval
+
+    def send(self, time_step):
+        heartbeat = self.create_heartbeat_message()
+        self.heartbeat_queue.put((random.randint(1, 10), heartbeat))
+        logger.debug("Sent heartbeat: %s at time %s", _BIN8[heartbeat['value']], time_step)
 
     def stop(self):
-        """ Stop the heartbeat sender thread """
+        """ Stop the heartbeat sender task """
         self.running = False
 
     def create_heartbeat_message(self):
-        binary_message = int_to_binary_string(random.randint(0, 255), bits=8)
-        parity = binary_message.count('1') % 2
+        # Raw 8-bit value rather than a "0101..." string; parity and flips are plain bit ops
+        value = random.randint(0, 255)
+        parity = PARITY[value]
         heartbeat = {
-            "binary_message": binary_message,
+            "value": value,
             "parity": parity,
             "sync": random.choice([True, False]),
             "error_type": random.choice([None, SINGLE_BIT, DOUBLE_BIT, BURST])
         }
         return heartbeat
 
-vehicles = []
-
-def flip_bit(binary_str, index):
-    """ Flip the bit at a given index """
-    flipped_bit = '1' if binary_str[index] == '0' else '0'
-    return binary_str[:index] + flipped_bit + binary_str[index + 1:]
+def merge_metrics(platoon):
+    """ Split the per-tick buffers into per-vehicle series once the platoon has stopped. """
+    steps = platoon._step
+    for vehicle_id in range(len(platoon)):
+        speed_data[vehicle_id] = platoon._speed_log[:steps, vehicle_id]
+        position_data[vehicle_id] = platoon._position_log[:steps, vehicle_id]
+        cwnd_data[vehicle_id] = platoon._cwnd_log[:steps, vehicle_id]
+    for error_type in error_data:
+        error_data[error_type] = platoon.errors[error_type]
+    # One timestamp per vehicle per step, as when each vehicle logged its own
+    time_data[:] = np.repeat(platoon._time_log[:steps], len(platoon)).tolist()
+
+def export_metrics(platoon):
+    """ Build the run's metrics as an Arrow table, one row per vehicle per step, and save it if asked. """
+    global metrics_table
+    steps, num_vehicles = platoon._step, len(platoon)
+    # Only the metric columns are zero-copy: .ravel() views the step-major buffers, while the
+    # t and vid index columns are built fresh by np.repeat and np.tile
+    metrics_table = pa.table({
+        "t": np.repeat(platoon._time_log[:steps], num_vehicles),
+        "vid": np.tile(np.arange(num_vehicles, dtype=np.int16), steps),
+        "speed": platoon._speed_log[:steps].ravel(),
+        "pos": platoon._position_log[:steps].ravel(),
+        "cwnd": platoon._cwnd_log[:steps].ravel(),
+    })
+    if METRICS_PARQUET:
+        pq.write_table(metrics_table, METRICS_PARQUET)
+
+def run_virtual(processes, duration):
+    """ Discrete-event loop: resume each generator process at its next event time until the duration runs out """
+    # A process yields the delay until its next event and is sent the simulated time when resumed;
+    # events due at the same moment run in the order the processes were given
+    events = [(next(process), order, process) for order, process in enumerate(processes)]
+    heapq.heapify(events)
+    while events and events[0][0] < duration:
+        now, order, process = heapq.heappop(events)
+        try:
+            delay = process.send(now)
+        except StopIteration:
+            continue
+        heapq.heappush(events, (now + delay, order, process))
 
 def create_vehicles_and_start_simulation(num_vehicles, simulation_duration):
-    global vehicles
-    heartbeat_queue = AgedPriorityQueue()
-    congestion_queue = queue.Queue()
+    step = make_step(MAX_SPEED)
+    heartbeat_queue = HeartbeatQueue()
+    congestion_queue = asyncio.Queue()
 
     heartbeat_sender = HeartbeatSender(heartbeat_queue)
-    heartbeat_sender.start()
-
-    for i in range(num_vehicles):
-        vehicle = Vehicle(vehicle_id=i, heartbeat_queue=heartbeat_queue, congestion_queue=congestion_queue)
-        vehicles.append(vehicle)
-        vehicle.start()
-
-    start_time = time.time()
-    while time.time() - start_time < simulation_duration:
-        time.sleep(1)  
-    heartbeat_sender.stop()
-    heartbeat_sender.join()
-
-    for vehicle in vehicles:
-        vehicle.stop()
-        vehicle.join()
+    # One step per tick, plus the step already under way at shutdown
+    max_steps = int(simulation_duration / TIME_STEP) + 2
+    platoon = Platoon(num_vehicles, heartbeat_queue, congestion_queue, max_steps=max_steps)
+
+    async def simulate():
+        runs = asyncio.gather(heartbeat_sender.run(), platoon.run(step))
+        await asyncio.sleep(simulation_duration)
+
+        heartbeat_sender.stop()
+        platoon.stop()
+        await runs
+
+    if VIRTUAL_TIME:
+        run_virtual([heartbeat_sender.process(), platoon.process(step)], simulation_duration)
+    else:
+        asyncio.run(simulate())
+
+    merge_metrics(platoon)
+    if pa is not None:
+        export_metrics(platoon)
 
 create_vehicles_and_start_simulation(5, 10)
\ No newline at end of file